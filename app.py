@@ -1,9 +1,14 @@
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.responses import ORJSONResponse, PlainTextResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.types import Receive, Scope, Send
 
-import os, json, time
-from typing import Any, Dict, List, Optional
+import os, json, time, sqlite3, threading, asyncio, logging, heapq
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import orjson
 
 # -----------------------------
 # CONFIG
@@ -12,11 +17,42 @@ DATABASE_URL = os.environ.get("DATABASE_URL", "").strip()
 SQLITE_PATH = os.environ.get("DB_PATH", "stats.db")
 USE_POSTGRES = bool(DATABASE_URL)
 
-app = FastAPI(title="CCA Matcher Backend", version="3.1")
+# Worker processes the Procfile starts (default 4 on Postgres, 1 on SQLite).
+# Only used to warn when SQLite runs several: its event counter is per process.
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+
+# Pool bounds are per worker process: the server sees up to
+# WEB_CONCURRENCY * PG_POOL_MAX connections in total.
+PG_POOL_MIN = int(os.environ.get("PG_POOL_MIN", "2"))
+PG_POOL_MAX = int(os.environ.get("PG_POOL_MAX", "10"))
+
+# Write-behind batching for /api/events
+EVENT_QUEUE_MAX = int(os.environ.get("EVENT_QUEUE_MAX", "10000"))
+EVENT_BATCH_SIZE = int(os.environ.get("EVENT_BATCH_SIZE", "100"))
+EVENT_FLUSH_SECONDS = float(os.environ.get("EVENT_FLUSH_SECONDS", "0.05"))
+
+# Seconds a computed /api/stats payload is reused (0 disables the cache)
+STATS_CACHE_TTL = float(os.environ.get("STATS_CACHE_TTL", "5"))
+# Max entries per /api/stats breakdown (0 returns every value)
+STATS_TOP_K = int(os.environ.get("STATS_TOP_K", "0"))
+
+# Optional origin allow-list as one regex, e.g. r"^https?://(localhost|127\.0\.0\.1)(:\d+)?$".
+# Unset keeps the public "*" policy.
+CORS_ORIGIN_REGEX = os.environ.get("CORS_ORIGIN_REGEX", "").strip() or None
+
+log = logging.getLogger("uvicorn.error")
+
+# Only the selected backend's driver is imported (see STORE below)
+if USE_POSTGRES:
+    from psycopg.rows import dict_row
+    from psycopg_pool import AsyncConnectionPool
+
+app = FastAPI(title="CCA Matcher Backend", version="3.1", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],          # you can restrict later
+    allow_origins=([] if CORS_ORIGIN_REGEX else ["*"]),
+    allow_origin_regex=CORS_ORIGIN_REGEX,   # restrict via env instead of a host list
     allow_credentials=False,
     allow_methods=["*"],          # IMPORTANT: allows DELETE + OPTIONS preflight
     allow_headers=["*"],
@@ -31,22 +67,301 @@ def norm(x: Any) -> str:
 def safe_list(x: Any) -> List[Any]:
     return x if isinstance(x, list) else []
 
-def count_map_add(m: Dict[str, int], key: Optional[str], inc: int = 1) -> None:
+def dumps(x: Any) -> str:
+    # Kept as str: the *_json columns are TEXT, and both drivers would bind
+    # bytes as BLOB/bytea instead (COPY would store them hex-escaped)
+    try:
+        return orjson.dumps(x).decode()
+    except orjson.JSONEncodeError:
+        # Request bodies can carry integers wider than 64 bits (see api_events);
+        # orjson refuses to encode those, stdlib json doesn't
+        return json.dumps(x, ensure_ascii=False)
+
+def loads_list(s: Optional[str]) -> List[Any]:
+    if not s:
+        return []
+    try:
+        return safe_list(orjson.loads(s))
+    except orjson.JSONDecodeError:
+        pass
+    try:
+        # Legacy rows written by stdlib json may hold NaN/Infinity
+        return safe_list(json.loads(s))
+    except Exception:
+        return []
+
+def interest_tags(values: List[Any]) -> List[str]:
+    """
+    Normalized interest tokens (trimmed, lowercased, blanks dropped), one per
+    occurrence, as counted by /api/stats.
+    """
+    return [tok for tok in (norm(t).lower() for t in values) if tok]
+
+def storable_text(s: str, allow_nul: bool) -> bool:
+    if not allow_nul and "\x00" in s:
+        return False
+    if s.isascii():
+        return True
+    try:
+        # Lone surrogates (e.g. an escaped "\ud800" in the body) have no UTF-8 form
+        s.encode("utf-8")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+def unstorable_field(row: Dict[str, Any], allow_nul: bool) -> Optional[str]:
+    """
+    Name of the first text value in `row` the database driver can't encode, or
+    None. Checked before queuing: such a row would fail its whole batch later.
+    """
+    for name, v in row.items():
+        for x in (v if isinstance(v, list) else (v,)):
+            if isinstance(x, str) and not storable_text(x, allow_nul):
+                return name
+    return None
+
+def dumps_list(items: List[Any]) -> str:
+    # Most payloads send empty lists; skip the encoder for those
+    return dumps(items) if items else "[]"
+
+def count_map_add(m: "Counter[str]", key: Optional[str], inc: int = 1) -> None:
     k = key if key and str(key).strip() else "(blank)"
-    m[k] = m.get(k, 0) + inc
+    m[k] += inc
+
+def _rank(kv: Tuple[str, int]) -> Tuple[int, str]:
+    return (-kv[1], kv[0].lower())
 
 def sort_dict(d: Dict[str, int]) -> Dict[str, int]:
-    return dict(sorted(d.items(), key=lambda kv: (-kv[1], kv[0].lower())))
+    return dict(sorted(d.items(), key=_rank))
+
+def top_k_dict(d: Dict[str, int], k: int) -> Dict[str, int]:
+    """
+    First k entries of sort_dict(d), without sorting the whole dict.
+    k <= 0 keeps everything.
+    """
+    if k <= 0 or k >= len(d):
+        return sort_dict(d)
+    return dict(heapq.nsmallest(k, d.items(), key=_rank))
 
 # -----------------------------
 # DB LAYER (Postgres or SQLite)
 # -----------------------------
-def init_db() -> None:
-    if USE_POSTGRES:
-        import psycopg
-        with psycopg.connect(DATABASE_URL) as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
+class DB:
+    """
+    One long-lived SQLite connection per process, in WAL mode.
+    Statements are serialized through `lock`; callers that need several
+    statements to run back-to-back hold it themselves (it is re-entrant).
+    The connection is in autocommit mode: writes go through transaction().
+    """
+    PRAGMAS = (
+        "PRAGMA synchronous=NORMAL;",
+        "PRAGMA temp_store=MEMORY;",
+        "PRAGMA cache_size=-64000;",
+    )
+    # Only meaningful for an on-disk database
+    FILE_PRAGMAS = (
+        "PRAGMA journal_mode=WAL;",
+        "PRAGMA mmap_size=268435456;",
+    )
+
+    def __init__(self, path: str) -> None:
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.lock = threading.RLock()
+        pragmas = self.PRAGMAS if path == ":memory:" else self.FILE_PRAGMAS + self.PRAGMAS
+        for pragma in pragmas:
+            self.conn.execute(pragma)
+
+    def execute(self, sql: str, params: Any = ()) -> sqlite3.Cursor:
+        with self.lock:
+            return self.conn.execute(sql, params)
+
+    def executemany(self, sql: str, seq: Any) -> sqlite3.Cursor:
+        with self.lock:
+            return self.conn.executemany(sql, seq)
+
+    @contextmanager
+    def transaction(self) -> Iterator["DB"]:
+        # IMMEDIATE takes the write lock up front, so two worker processes
+        # can't both read-lock and then deadlock upgrading to a write.
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE;")
+            try:
+                yield self
+            except BaseException:
+                self.conn.execute("ROLLBACK;")
+                raise
+            self.conn.execute("COMMIT;")
+
+class EventCounter:
+    """
+    In-process running total of accepted events, so writes never need COUNT(*).
+    Seeded once on startup from the table; bumped when a row is accepted and
+    rolled back if its write fails. On Postgres each commit also resyncs it to
+    the shared event id (see insert_events).
+    """
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._value = 0
+
+    def set(self, value: int) -> None:
+        with self._lock:
+            self._value = value
+
+    def add(self, inc: int) -> int:
+        with self._lock:
+            self._value += inc
+            return self._value
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+EVENT_COUNT = EventCounter()
+# Rows accepted into EVENT_QUEUE and not yet committed (or dropped)
+UNFLUSHED = EventCounter()
+
+# Same DDL on both backends. Each STATS_SQL query filters on one event_type,
+# so its index is partial on that filter: only matching rows are indexed and
+# the GROUP BY walks the index in order. event_type is carried as a trailing
+# column because SQLite only treats an index as covering if it holds every
+# column the query names. There is deliberately no plain event_type index:
+# without ANALYZE stats SQLite would pick it over these and sort in a temp B-tree.
+EVENT_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_events_gen_cat ON events (category_selected, event_type) WHERE event_type = 'generate';",
+    "CREATE INDEX IF NOT EXISTS idx_events_gen_activity ON events (activity_type_selected, event_type) WHERE event_type = 'generate';",
+    "CREATE INDEX IF NOT EXISTS idx_events_gen_grade ON events (grade, event_type) WHERE event_type = 'generate';",
+    "CREATE INDEX IF NOT EXISTS idx_events_gen_gender ON events (gender, event_type) WHERE event_type = 'generate';",
+    "CREATE INDEX IF NOT EXISTS idx_events_shortlist ON events (shortlisted_cca, event_type) WHERE event_type = 'shortlist';",
+    "CREATE INDEX IF NOT EXISTS event_interests_tag ON event_interests (tag);",
+)
+
+# One row per interest tag of a generate event (see interest_tags)
+EVENT_INTERESTS_DDL = """
+    CREATE TABLE IF NOT EXISTS event_interests (
+        event_id INTEGER NOT NULL REFERENCES events (id) ON DELETE CASCADE,
+        tag TEXT NOT NULL
+    );
+"""
+
+# Events stored before event_interests existed only carry interests_json;
+# STORE.init() fills their tags in once. Whether that has happened is recorded
+# as the schema version (PRAGMA user_version on SQLite, schema_meta on
+# Postgres), not inferred from event_interests: it stays empty for good when
+# no event has a non-blank interest.
+SCHEMA_VERSION = 1  # 1: event_interests backfilled
+
+BACKFILL_SOURCE_SQL = """
+    SELECT id, interests_json FROM events
+    WHERE event_type = 'generate' AND interests_json IS NOT NULL AND interests_json <> '[]'
+"""
+
+BACKFILL_CHUNK = 2000  # source rows held in memory at a time
+
+def backfill_tags(rows: Iterable[Tuple[int, Optional[str]]]) -> List[Tuple[int, str]]:
+    return [(event_id, tag) for event_id, blob in rows for tag in interest_tags(loads_list(blob))]
+
+EVENT_COLUMNS = """
+    ts, event_type, category_selected, activity_type_selected,
+    grade, gender, interests_json, shown_ccas_json, shortlisted_cca
+"""
+
+def event_params(r: Dict[str, Any]) -> Tuple[Any, ...]:
+    # Same order as EVENT_COLUMNS
+    return (
+        r["ts"], r["event_type"], r["category_selected"], r["activity_type_selected"],
+        r["grade"], r["gender"], r["interests_json"], r["shown_ccas_json"], r["shortlisted_cca"]
+    )
+
+# Aggregates for /api/stats, one (k, c) row per distinct value.
+# Blank/NULL handling stays in Python (count_map_add) so it matches the old loop.
+STATS_SQL: Dict[str, str] = {
+    # api_events only stores these two types; each count hits a partial index
+    "event_types": """
+        SELECT 'generate' AS k, COUNT(*) AS c FROM events WHERE event_type = 'generate'
+        UNION ALL
+        SELECT 'shortlist' AS k, COUNT(*) AS c FROM events WHERE event_type = 'shortlist'
+    """,
+    "categories": """
+        SELECT category_selected AS k, COUNT(*) AS c FROM events
+        WHERE event_type = 'generate' GROUP BY category_selected
+    """,
+    "activity_types": """
+        SELECT activity_type_selected AS k, COUNT(*) AS c FROM events
+        WHERE event_type = 'generate' GROUP BY activity_type_selected
+    """,
+    "grades": """
+        SELECT grade AS k, COUNT(*) AS c FROM events
+        WHERE event_type = 'generate' GROUP BY grade
+    """,
+    "genders": """
+        SELECT gender AS k, COUNT(*) AS c FROM events
+        WHERE event_type = 'generate' GROUP BY gender
+    """,
+    "shortlisted": """
+        SELECT shortlisted_cca AS k, COUNT(*) AS c FROM events
+        WHERE event_type = 'shortlist' AND shortlisted_cca <> '' GROUP BY shortlisted_cca
+    """,
+    "interests": "SELECT tag AS k, COUNT(*) AS c FROM event_interests GROUP BY tag",
+}
+
+class PgStore:
+    """
+    Postgres through one async connection pool per process; opened on
+    startup, closed on shutdown.
+    """
+    name = "postgres"
+    # The serial id is shared by every worker and restarts on clear, so each
+    # commit can resync EVENT_COUNT to it (see insert_events)
+    ids_are_totals = True
+    # TEXT values can't hold NUL characters
+    allows_nul = False
+
+    INIT_LOCK_KEY = 0x63636D61  # arbitrary advisory-lock id for init()
+
+    # Single row holding the data-migration version (see SCHEMA_VERSION)
+    SCHEMA_META_DDL = """
+        CREATE TABLE IF NOT EXISTS schema_meta (
+            singleton BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (singleton),
+            version INTEGER NOT NULL
+        );
+    """
+
+    INSERT_SQL = f"INSERT INTO events ({EVENT_COLUMNS}) VALUES ({','.join(['%s'] * 9)})"
+    # Single rows take their id from RETURNING; batches reserve ids first so
+    # both COPYs agree on event_id
+    INSERT_RETURNING_ID_SQL = INSERT_SQL + " RETURNING id"
+    NEXT_IDS_SQL = "SELECT nextval(pg_get_serial_sequence('events', 'id')) AS id FROM generate_series(1, %s)"
+    COPY_EVENTS_SQL = f"COPY events (id, {EVENT_COLUMNS}) FROM STDIN"
+    COPY_INTERESTS_SQL = "COPY event_interests (event_id, tag) FROM STDIN"
+
+    def __init__(self) -> None:
+        self.pool = AsyncConnectionPool(
+            DATABASE_URL,
+            min_size=PG_POOL_MIN,
+            max_size=PG_POOL_MAX,
+            open=False,
+            # prepare_threshold=0: server-side prepare on first use, so the hot
+            # INSERT/SELECTs are parsed and planned once per pooled connection
+            kwargs={"row_factory": dict_row, "prepare_threshold": 0},
+        )
+
+    async def open(self) -> None:
+        await self.pool.open(wait=True)
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+    async def _copy_tags(self, cur: Any, tags: List[Tuple[int, str]]) -> None:
+        async with cur.copy(self.COPY_INTERESTS_SQL) as cp:
+            for t in tags:
+                await cp.write_row(t)
+
+    async def init(self) -> None:
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                # Workers start together; let one of them create and backfill
+                await cur.execute("SELECT pg_advisory_xact_lock(%s);", (self.INIT_LOCK_KEY,))
+                await cur.execute("""
                     CREATE TABLE IF NOT EXISTS events (
                         id SERIAL PRIMARY KEY,
                         ts BIGINT NOT NULL,
@@ -62,232 +377,493 @@ def init_db() -> None:
                         shortlisted_cca TEXT
                     );
                 """)
-            conn.commit()
-    else:
-        import sqlite3
-        conn = sqlite3.connect(SQLITE_PATH)
-        cur = conn.cursor()
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS events (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                ts INTEGER NOT NULL,
-                event_type TEXT NOT NULL,
-
-                category_selected TEXT,
-                activity_type_selected TEXT,
-                grade TEXT,
-                gender TEXT,
-
-                interests_json TEXT,
-                shown_ccas_json TEXT,
-                shortlisted_cca TEXT
-            );
-        """)
-        conn.commit()
-        conn.close()
-
-def insert_event(row: Dict[str, Any]) -> int:
+                await cur.execute(EVENT_INTERESTS_DDL)
+                for ddl in EVENT_INDEXES:
+                    await cur.execute(ddl)
+
+                await cur.execute(self.SCHEMA_META_DDL)
+                await cur.execute("SELECT version FROM schema_meta;")
+                meta = await cur.fetchone()
+                if (meta["version"] if meta else 0) < SCHEMA_VERSION:
+                    # Start from empty so an interrupted earlier run can't double count
+                    await cur.execute("TRUNCATE event_interests;")
+                    # Named (server-side) cursor: stream the events table in
+                    # chunks instead of buffering every row client-side
+                    async with conn.cursor(name="interests_backfill") as src:
+                        src.itersize = BACKFILL_CHUNK
+                        await src.execute(BACKFILL_SOURCE_SQL)
+                        while rows := await src.fetchmany(BACKFILL_CHUNK):
+                            tags = backfill_tags((r["id"], r["interests_json"]) for r in rows)
+                            if tags:
+                                await self._copy_tags(cur, tags)
+                    await cur.execute(
+                        "INSERT INTO schema_meta (version) VALUES (%s) "
+                        "ON CONFLICT (singleton) DO UPDATE SET version = EXCLUDED.version;",
+                        (SCHEMA_VERSION,),
+                    )
+            await conn.commit()
+
+    async def insert(self, rows: List[Dict[str, Any]]) -> int:
+        params = [event_params(r) for r in rows]
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                if len(params) == 1:
+                    # COPY setup isn't worth it for a single row
+                    await cur.execute(self.INSERT_RETURNING_ID_SQL, params[0])
+                    ids = [(await cur.fetchone())["id"]]
+                else:
+                    await cur.execute(self.NEXT_IDS_SQL, (len(params),))
+                    ids = [r["id"] async for r in cur]
+                    async with cur.copy(self.COPY_EVENTS_SQL) as cp:
+                        for event_id, p in zip(ids, params):
+                            await cp.write_row((event_id, *p))
+
+                tags = [(event_id, tag) for event_id, r in zip(ids, rows) for tag in r["interest_tags"]]
+                if tags:
+                    await self._copy_tags(cur, tags)
+            await conn.commit()
+        return ids[-1]
+
+    async def count(self) -> int:
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute("SELECT COUNT(*) AS n FROM events;")
+                return int((await cur.fetchone())["n"])
+
+    async def fetch_stats_groups(self) -> Dict[str, List[Tuple[Any, int]]]:
+        async with self.pool.connection() as conn:
+            # Send every query before reading any result: one round trip
+            cursors = []
+            async with conn.pipeline():
+                for name, sql in STATS_SQL.items():
+                    cur = conn.cursor()
+                    await cur.execute(sql)
+                    cursors.append((name, cur))
+            out: Dict[str, List[Tuple[Any, int]]] = {}
+            for name, cur in cursors:
+                out[name] = [(r["k"], r["c"]) async for r in cur]
+                await cur.close()
+            return out
+
+    async def clear(self) -> int:
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                # TRUNCATE reports no row count. Count first, in its own
+                # transaction, so the scan runs without blocking anyone;
+                # rows added in between are dropped but not counted.
+                await cur.execute("SELECT COUNT(*) AS n FROM events;")
+                deleted = (await cur.fetchone())["n"]
+                await conn.commit()
+                # Exclusive lock only for the O(1) heap swap
+                await cur.execute("TRUNCATE events, event_interests RESTART IDENTITY;")
+            await conn.commit()
+        return int(deleted or 0)
+
+class SqliteStore:
     """
-    Inserts an event. Returns total event count after insert (for debugging).
+    SQLite through the process-wide DB connection. There is no async driver,
+    so each call runs its blocking half in a worker thread.
     """
-    if USE_POSTGRES:
-        import psycopg
-        with psycopg.connect(DATABASE_URL) as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO events (
-                        ts, event_type, category_selected, activity_type_selected,
-                        grade, gender, interests_json, shown_ccas_json, shortlisted_cca
-                    ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                """, (
-                    row["ts"], row["event_type"], row["category_selected"], row["activity_type_selected"],
-                    row["grade"], row["gender"], row["interests_json"], row["shown_ccas_json"], row["shortlisted_cca"]
-                ))
-                cur.execute("SELECT COUNT(*) FROM events;")
-                total = cur.fetchone()[0]
-            conn.commit()
-        return int(total)
-    else:
-        import sqlite3
-        conn = sqlite3.connect(SQLITE_PATH)
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO events (
-                ts, event_type, category_selected, activity_type_selected,
-                grade, gender, interests_json, shown_ccas_json, shortlisted_cca
-            ) VALUES (?,?,?,?,?,?,?,?,?)
-        """, (
-            row["ts"], row["event_type"], row["category_selected"], row["activity_type_selected"],
-            row["grade"], row["gender"], row["interests_json"], row["shown_ccas_json"], row["shortlisted_cca"]
-        ))
-        conn.commit()
-        cur.execute("SELECT COUNT(*) FROM events;")
-        total = cur.fetchone()[0]
-        conn.close()
-        return int(total)
-
-def fetch_all_events() -> List[Dict[str, Any]]:
-    if USE_POSTGRES:
-        import psycopg
-        with psycopg.connect(DATABASE_URL) as conn:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT ts,event_type,category_selected,activity_type_selected,grade,gender,
-                           interests_json,shown_ccas_json,shortlisted_cca
-                    FROM events
-                    ORDER BY ts DESC
-                """)
-                rows = cur.fetchall()
-
-        out: List[Dict[str, Any]] = []
-        for r in rows:
-            out.append({
-                "ts": r[0], "event_type": r[1],
-                "category_selected": r[2], "activity_type_selected": r[3],
-                "grade": r[4], "gender": r[5],
-                "interests_json": r[6], "shown_ccas_json": r[7],
-                "shortlisted_cca": r[8],
-            })
-        return out
-    else:
-        import sqlite3
-        conn = sqlite3.connect(SQLITE_PATH)
-        conn.row_factory = sqlite3.Row
-        rows = conn.execute("""
-            SELECT ts,event_type,category_selected,activity_type_selected,grade,gender,
-                   interests_json,shown_ccas_json,shortlisted_cca
-            FROM events
-            ORDER BY ts DESC
-        """).fetchall()
-        conn.close()
-        return [dict(r) for r in rows]
-
-def clear_all_events() -> int:
+    name = "sqlite"
+    ids_are_totals = False
+    allows_nul = True
+
+    INSERT_SQL = f"INSERT INTO events ({EVENT_COLUMNS}) VALUES ({','.join(['?'] * 9)})"
+    INSERT_INTEREST_SQL = "INSERT INTO event_interests (event_id, tag) VALUES (?, ?)"
+
+    def __init__(self) -> None:
+        self.db: Optional[DB] = None
+
+    async def open(self) -> None:
+        if self.db is None:
+            self.db = DB(SQLITE_PATH)
+
+    async def close(self) -> None:
+        # The connection lives as long as the process (WAL is checkpointed on exit)
+        pass
+
+    async def init(self) -> None:
+        await asyncio.to_thread(self._init)
+
+    def _init(self) -> None:
+        d = self.db
+        with d.transaction():
+            d.execute("""
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    ts INTEGER NOT NULL,
+                    event_type TEXT NOT NULL,
+
+                    category_selected TEXT,
+                    activity_type_selected TEXT,
+                    grade TEXT,
+                    gender TEXT,
+
+                    interests_json TEXT,
+                    shown_ccas_json TEXT,
+                    shortlisted_cca TEXT
+                );
+            """)
+            d.execute(EVENT_INTERESTS_DDL)
+            for ddl in EVENT_INDEXES:
+                d.execute(ddl)
+
+            if d.execute("PRAGMA user_version;").fetchone()[0] < SCHEMA_VERSION:
+                # Start from empty so an interrupted earlier run can't double count
+                d.execute("DELETE FROM event_interests;")
+                src = d.execute(BACKFILL_SOURCE_SQL)
+                while rows := src.fetchmany(BACKFILL_CHUNK):
+                    tags = backfill_tags(rows)
+                    if tags:
+                        d.executemany(self.INSERT_INTEREST_SQL, tags)
+                # PRAGMA takes no bound parameters; the value is our own constant
+                d.execute(f"PRAGMA user_version = {SCHEMA_VERSION};")
+
+    async def insert(self, rows: List[Dict[str, Any]]) -> int:
+        return await asyncio.to_thread(self._insert, rows)
+
+    def _insert(self, rows: List[Dict[str, Any]]) -> int:
+        d = self.db
+        with d.transaction():
+            event_id = 0
+            tags: List[Tuple[int, str]] = []
+            for r in rows:
+                # executemany doesn't report rowids; per-row execute inside one
+                # transaction is still a single commit
+                event_id = d.execute(self.INSERT_SQL, event_params(r)).lastrowid
+                tags.extend((event_id, tag) for tag in r["interest_tags"])
+            if tags:
+                d.executemany(self.INSERT_INTEREST_SQL, tags)
+        return event_id
+
+    async def count(self) -> int:
+        return await asyncio.to_thread(self._count)
+
+    def _count(self) -> int:
+        d = self.db
+        # Hold the lock while the cursor is stepped, not just while it's created
+        with d.lock:
+            return int(d.execute("SELECT COUNT(*) FROM events;").fetchone()[0])
+
+    async def fetch_stats_groups(self) -> Dict[str, List[Tuple[Any, int]]]:
+        return await asyncio.to_thread(self._fetch_stats_groups)
+
+    def _fetch_stats_groups(self) -> Dict[str, List[Tuple[Any, int]]]:
+        d = self.db
+        with d.lock:
+            # Plain tuples already have the (k, c) shape
+            return {name: d.execute(sql).fetchall() for name, sql in STATS_SQL.items()}
+
+    async def clear(self) -> int:
+        return await asyncio.to_thread(self._clear)
+
+    def _clear(self) -> int:
+        d = self.db
+        with d.lock:
+            with d.transaction():
+                d.execute("DELETE FROM event_interests;")
+                deleted = d.execute("DELETE FROM events;").rowcount
+            # Give the freed pages back to the OS; must run outside a transaction
+            d.execute("VACUUM;")
+        return int(deleted or 0)
+
+# Backend is chosen once, at import; nothing below branches on USE_POSTGRES.
+STORE: Any = PgStore() if USE_POSTGRES else SqliteStore()
+
+async def insert_events(rows: List[Dict[str, Any]]) -> int:
+    """
+    Inserts a batch of events in a single transaction.
+    Returns the id of the last event written.
+    """
+    last_id = await STORE.insert(rows)
+    stats_cache_invalidate()
+    return last_id
+
+def resync_event_count(last_id: int) -> None:
+    """
+    After a commit, re-base EVENT_COUNT on the shared id where the store has
+    one. Every worker's commits advance that id, so this pulls in their events
+    too; this worker's rows still waiting to be flushed aren't in it yet.
+    """
+    if STORE.ids_are_totals:
+        EVENT_COUNT.set(last_id + UNFLUSHED.value)
+
+async def clear_all_events() -> int:
     """
     Deletes all events and returns how many rows were deleted (best-effort).
     """
-    if USE_POSTGRES:
-        import psycopg
-        with psycopg.connect(DATABASE_URL) as conn:
-            with conn.cursor() as cur:
-                # RETURNING gives us deleted count reliably on Postgres
-                cur.execute("DELETE FROM events RETURNING 1;")
-                deleted = cur.rowcount  # should be number of deleted rows
-            conn.commit()
-        return int(deleted or 0)
-    else:
-        import sqlite3
-        conn = sqlite3.connect(SQLITE_PATH)
-        cur = conn.cursor()
-        cur.execute("DELETE FROM events;")
-        deleted = cur.rowcount
-        conn.commit()
-        conn.close()
-        return int(deleted or 0)
+    # Rows this worker already acknowledged must not land after the clear
+    await flush_queued_events()
+    deleted = await STORE.clear()
+    # Anything queued since the barrier is still to be written
+    EVENT_COUNT.set(UNFLUSHED.value)
+    stats_cache_invalidate()
+    return deleted
+
+# -----------------------------
+# STATS CACHE
+# -----------------------------
+# Serialized JSON bodies keyed by endpoint, expired after STATS_CACHE_TTL and
+# dropped on every write, so a hit is served without re-encoding. The
+# generation number stops a computation that raced with a write from storing
+# its (already stale) result.
+_stats_cache: Dict[str, Tuple[float, bytes]] = {}
+_stats_gen = 0
+
+def stats_cache_get(key: str) -> Optional[bytes]:
+    hit = _stats_cache.get(key)
+    if hit is None or time.monotonic() >= hit[0]:
+        return None
+    return hit[1]
+
+def stats_cache_put(key: str, gen: int, body: bytes) -> None:
+    if STATS_CACHE_TTL > 0 and gen == _stats_gen:
+        _stats_cache[key] = (time.monotonic() + STATS_CACHE_TTL, body)
+
+def stats_cache_invalidate() -> None:
+    global _stats_gen
+    _stats_gen += 1
+    _stats_cache.clear()
+
+# -----------------------------
+# WRITE-BEHIND QUEUE
+# -----------------------------
+# api_events only enqueues; flush_events() drains the queue in batches of up to
+# EVENT_BATCH_SIZE rows, waiting at most EVENT_FLUSH_SECONDS after the first row.
+# A None item is the shutdown sentinel: flush what is pending and exit.
+# A Future item is a barrier (see flush_queued_events): flush what is pending,
+# then resolve it.
+EVENT_QUEUE: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=EVENT_QUEUE_MAX)
+_flush_task: Optional["asyncio.Task[None]"] = None
+
+def _release(barrier: "asyncio.Future[None]") -> None:
+    if not barrier.done():  # the waiter may have been cancelled
+        barrier.set_result(None)
+
+async def flush_events() -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        first = await EVENT_QUEUE.get()
+        if first is None:
+            return
+        if isinstance(first, asyncio.Future):
+            _release(first)
+            continue
+        batch = [first]
+        stopping = False
+        barrier = None
+        deadline = loop.time() + EVENT_FLUSH_SECONDS
+        while len(batch) < EVENT_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                row = await asyncio.wait_for(EVENT_QUEUE.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if row is None:
+                stopping = True
+                break
+            if isinstance(row, asyncio.Future):
+                barrier = row
+                break
+            batch.append(row)
+
+        try:
+            last_id = await insert_events(batch)
+        except Exception:
+            UNFLUSHED.add(-len(batch))
+            EVENT_COUNT.add(-len(batch))
+            log.exception("Dropped %d queued events: batch insert failed", len(batch))
+        else:
+            UNFLUSHED.add(-len(batch))
+            resync_event_count(last_id)
+
+        if barrier is not None:
+            _release(barrier)
+        if stopping:
+            return
+
+async def flush_queued_events() -> None:
+    """
+    Waits until every row queued by this worker so far is written (or dropped).
+    """
+    if _flush_task is None or _flush_task.done():
+        return
+    barrier = asyncio.get_running_loop().create_future()
+    await EVENT_QUEUE.put(barrier)
+    await barrier
+
+# -----------------------------
+# STARTUP
+# -----------------------------
+@app.on_event("startup")
+async def on_startup() -> None:
+    global _flush_task
+    await STORE.open()
+    # Schema is created once per process; handlers assume the table exists.
+    await STORE.init()
+    EVENT_COUNT.set(await STORE.count())
+    if WEB_CONCURRENCY > 1 and not STORE.ids_are_totals:
+        log.warning(
+            "WEB_CONCURRENCY=%d on %s: each worker counts only its own events, "
+            "so totalEventsNow will undercount", WEB_CONCURRENCY, STORE.name
+        )
+    _flush_task = asyncio.create_task(flush_events())
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    if _flush_task is not None:
+        await EVENT_QUEUE.put(None)
+        await _flush_task
+    await STORE.close()
 
 # -----------------------------
 # ROUTES
 # -----------------------------
+class SharedResponse(PlainTextResponse):
+    """
+    A response built once and returned from every request. Middleware edits
+    the sent header list in place (CORS appends to it), so each send gets a copy.
+    """
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": list(self.raw_headers)})
+        await send({"type": "http.response.body", "body": self.body})
+
+# Health checks and load balancer probes hit "/" far more than anything else
+_OK_RESPONSE = SharedResponse("OK")
+
 @app.get("/", response_class=PlainTextResponse)
-def home():
-    return "OK"
+async def home():
+    return _OK_RESPONSE
+
+# Row key -> request field it is built from (for error messages)
+REQUEST_FIELDS = {
+    "event_type": "eventType",
+    "category_selected": "categorySelected",
+    "activity_type_selected": "activityTypeSelected",
+    "grade": "grade",
+    "gender": "gender",
+    "interests_json": "interests",
+    "shown_ccas_json": "shownCCAs",
+    "shortlisted_cca": "shortlistedCCA",
+    "interest_tags": "interests",
+}
 
 @app.post("/api/events")
 async def api_events(request: Request):
-    init_db()
-
     # Safe JSON parse (never 500)
     try:
+        # Stdlib parser on purpose: it accepts NaN/Infinity, BOM/UTF-16 bodies and
+        # keeps integers wider than 64 bits exact, which orjson does not
         data = await request.json()
         if not isinstance(data, dict):
             data = {}
     except Exception:
         data = {}
 
-    event_type = norm(data.get("eventType"))
+    get = data.get
+    event_type = norm(get("eventType"))
     if event_type not in ("generate", "shortlist"):
-        return JSONResponse(
+        return ORJSONResponse(
             {"ok": False, "error": "Invalid or missing eventType (use 'generate' or 'shortlist')"},
             status_code=400
         )
 
+    # Read each field once
+    activity_type = get("activityTypeSelected")
+    grade = get("grade")
+    interests = safe_list(get("interests"))[:200]
+
     row = {
-        "ts": int(time.time() * 1000),
+        "ts": time.time_ns() // 1_000_000,
         "event_type": event_type,
-        "category_selected": (norm(data.get("categorySelected")) or None),
-        "activity_type_selected": (None if data.get("activityTypeSelected") is None else norm(data.get("activityTypeSelected"))),
-        "grade": (None if data.get("grade") is None else norm(data.get("grade"))),
-        "gender": (norm(data.get("gender")) or None),
-        "interests_json": json.dumps(safe_list(data.get("interests"))[:200], ensure_ascii=False),
-        "shown_ccas_json": json.dumps(safe_list(data.get("shownCCAs"))[:50], ensure_ascii=False),
-        "shortlisted_cca": (norm(data.get("shortlistedCCA")) or None),
+        "category_selected": (norm(get("categorySelected")) or None),
+        "activity_type_selected": (None if activity_type is None else norm(activity_type)),
+        "grade": (None if grade is None else norm(grade)),
+        "gender": (norm(get("gender")) or None),
+        "interests_json": dumps_list(interests),
+        "shown_ccas_json": dumps_list(safe_list(get("shownCCAs"))[:50]),
+        "shortlisted_cca": (norm(get("shortlistedCCA")) or None),
+        # Only generate events feed the interests breakdown
+        "interest_tags": (interest_tags(interests) if event_type == "generate" else []),
     }
 
-    total = insert_event(row)
-    return {"ok": True, "totalEventsNow": total, "storage": ("postgres" if USE_POSTGRES else "sqlite")}
+    bad_field = unstorable_field(row, STORE.allows_nul)
+    if bad_field is not None:
+        return ORJSONResponse(
+            {"ok": False, "error": f"Field '{REQUEST_FIELDS[bad_field]}' contains text that can't be stored"},
+            status_code=400
+        )
+
+    # Counted when accepted on both paths (and taken back if the write fails),
+    # so both report the same running total
+    if request.query_params.get("sync") in ("1", "true"):
+        # Caller wants the row committed before we answer: skip the queue
+        EVENT_COUNT.add(1)
+        try:
+            resync_event_count(await insert_events([row]))
+        except Exception as e:
+            EVENT_COUNT.add(-1)
+            raise HTTPException(status_code=500, detail=str(e))
+        total = EVENT_COUNT.value
+    else:
+        await EVENT_QUEUE.put(row)
+        UNFLUSHED.add(1)
+        total = EVENT_COUNT.add(1)
+    return {"ok": True, "totalEventsNow": total, "storage": STORE.name}
 
 @app.delete("/api/stats")
-def api_clear_stats():
-    init_db()
+async def api_clear_stats():
     try:
-        deleted = clear_all_events()
-        return {"ok": True, "status": "cleared", "deleted": deleted, "storage": ("postgres" if USE_POSTGRES else "sqlite")}
+        deleted = await clear_all_events()
+        return {"ok": True, "status": "cleared", "deleted": deleted, "storage": STORE.name}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/stats")
-def api_stats():
-    init_db()
-    rows = fetch_all_events()
-
-    total_events = len(rows)
-
-    categories: Dict[str, int] = {}
-    activity_types: Dict[str, int] = {}
-    grades: Dict[str, int] = {}
-    genders: Dict[str, int] = {}
-    interests: Dict[str, int] = {}
-    shortlisted: Dict[str, int] = {}
-
-    generate_events = 0
-    shortlist_events = 0
-
-    for r in rows:
-        et = r.get("event_type")
-
-        if et == "generate":
-            generate_events += 1
-            count_map_add(categories, r.get("category_selected"))
-            # If not Activity, activity_type_selected may be null → treat as (n/a)
-            count_map_add(activity_types, r.get("activity_type_selected") or "(n/a)")
-            count_map_add(grades, r.get("grade"))
-            count_map_add(genders, r.get("gender") or "Any")
-
-            try:
-                ints = json.loads(r.get("interests_json") or "[]")
-            except Exception:
-                ints = []
-
-            for t in ints:
-                tok = norm(t).lower()
-                if tok:
-                    count_map_add(interests, tok)
-
-        elif et == "shortlist":
-            shortlist_events += 1
-            name = r.get("shortlisted_cca")
-            if name:
-                count_map_add(shortlisted, name)
-
-    return {
-        "storage": ("postgres" if USE_POSTGRES else "sqlite"),
-        "totalEvents": total_events,
-        "generateEvents": generate_events,
-        "shortlistEvents": shortlist_events,
-        "categories": sort_dict(categories),
-        "activityTypes": sort_dict(activity_types),
-        "grades": sort_dict(grades),
-        "genders": sort_dict(genders),
-        "interests": sort_dict(interests),
-        "shortlisted": sort_dict(shortlisted),
+async def api_stats():
+    cached = stats_cache_get("stats")
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
+    gen = _stats_gen
+    groups = await STORE.fetch_stats_groups()
+
+    event_types = dict(groups["event_types"])
+    categories: "Counter[str]" = Counter()
+    activity_types: "Counter[str]" = Counter()
+    grades: "Counter[str]" = Counter()
+    genders: "Counter[str]" = Counter()
+    interests: "Counter[str]" = Counter()
+    shortlisted: "Counter[str]" = Counter()
+
+    for k, c in groups["categories"]:
+        count_map_add(categories, k, c)
+    for k, c in groups["activity_types"]:
+        # If not Activity, activity_type_selected may be null → treat as (n/a)
+        count_map_add(activity_types, k or "(n/a)", c)
+    for k, c in groups["grades"]:
+        count_map_add(grades, k, c)
+    for k, c in groups["genders"]:
+        count_map_add(genders, k or "Any", c)
+    # Tags were normalized by interest_tags() when written: nothing to clean up
+    interests.update(dict(groups["interests"]))
+    for k, c in groups["shortlisted"]:
+        count_map_add(shortlisted, k, c)
+
+    payload = {
+        "storage": STORE.name,
+        "totalEvents": sum(event_types.values()),
+        "generateEvents": event_types.get("generate", 0),
+        "shortlistEvents": event_types.get("shortlist", 0),
+        "categories": top_k_dict(categories, STATS_TOP_K),
+        "activityTypes": top_k_dict(activity_types, STATS_TOP_K),
+        "grades": top_k_dict(grades, STATS_TOP_K),
+        "genders": top_k_dict(genders, STATS_TOP_K),
+        "interests": top_k_dict(interests, STATS_TOP_K),
+        "shortlisted": top_k_dict(shortlisted, STATS_TOP_K),
     }
+    body = orjson.dumps(payload)
+    stats_cache_put("stats", gen, body)
+    return Response(content=body, media_type="application/json")
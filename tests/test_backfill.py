@@ -0,0 +1,128 @@
+"""
+event_interests backfill on a database written by the original app
+(events table only, interests kept as JSON text).
+
+Run from the repo root: python -m unittest discover tests
+"""
+import asyncio, importlib, json, os, sqlite3, tempfile, unittest
+from unittest import mock
+
+import orjson
+
+# Schema as created by the original app, before event_interests existed
+BASELINE_DDL = """
+    CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts INTEGER NOT NULL,
+        event_type TEXT NOT NULL,
+
+        category_selected TEXT,
+        activity_type_selected TEXT,
+        grade TEXT,
+        gender TEXT,
+
+        interests_json TEXT,
+        shown_ccas_json TEXT,
+        shortlisted_cca TEXT
+    );
+"""
+
+# (event_type, category, activity_type, grade, gender, interests_json, shortlisted_cca)
+BASELINE_ROWS = [
+    ("generate", "Sports", None, "Sec 1", None,
+     json.dumps(["Music", " music ", "Art", None, 5, "Ünï", ""], ensure_ascii=False), None),
+    ("generate", "", "Outdoor", None, "F", "[]", None),
+    # stdlib json wrote NaN as a bare literal
+    ("generate", "Arts", None, "Sec 2", "M", '[NaN, "ART"]', None),
+    ("generate", None, None, None, None, None, None),
+    ("generate", None, None, None, None, "not json", None),
+    ("shortlist", None, None, None, None, '["ignored"]', "Band"),
+    ("shortlist", None, None, None, None, "[]", ""),
+]
+
+# /api/stats as the original app reported it for BASELINE_ROWS
+BASELINE_STATS = {
+    "storage": "sqlite",
+    "totalEvents": 7,
+    "generateEvents": 5,
+    "shortlistEvents": 2,
+    "categories": {"(blank)": 3, "Arts": 1, "Sports": 1},
+    "activityTypes": {"(n/a)": 4, "Outdoor": 1},
+    "grades": {"(blank)": 3, "Sec 1": 1, "Sec 2": 1},
+    "genders": {"Any": 3, "F": 1, "M": 1},
+    "interests": {"art": 2, "music": 2, "5": 1, "nan": 1, "ünï": 1},
+    "shortlisted": {"Band": 1},
+}
+
+def make_baseline_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute(BASELINE_DDL)
+    conn.executemany(
+        "INSERT INTO events (ts, event_type, category_selected, activity_type_selected, "
+        "grade, gender, interests_json, shown_ccas_json, shortlisted_cca) "
+        "VALUES (0, ?, ?, ?, ?, ?, ?, '[]', ?)",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+
+class BackfillTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "stats.db")
+        env = mock.patch.dict(os.environ, {"DB_PATH": self.path, "DATABASE_URL": "", "STATS_CACHE_TTL": "0"})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def start_app(self):
+        # Config is read at import: reload so each start sees this test's DB
+        import app
+        return importlib.reload(app)
+
+    def stats_after_startup(self, app):
+        async def run():
+            await app.on_startup()
+            try:
+                return orjson.loads((await app.api_stats()).body)
+            finally:
+                await app.on_shutdown()
+        return asyncio.run(run())
+
+    def user_version(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute("PRAGMA user_version;").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_stats_unchanged_after_backfill(self):
+        make_baseline_db(self.path, BASELINE_ROWS)
+        stats = self.stats_after_startup(self.start_app())
+        self.assertEqual(stats, BASELINE_STATS)
+        self.assertEqual(list(stats["interests"]), list(BASELINE_STATS["interests"]))
+
+    def test_backfill_runs_once(self):
+        make_baseline_db(self.path, BASELINE_ROWS)
+        self.stats_after_startup(self.start_app())
+
+        app = self.start_app()
+        with mock.patch.object(app, "backfill_tags", side_effect=AssertionError("backfill re-ran")):
+            stats = self.stats_after_startup(app)
+        self.assertEqual(stats, BASELINE_STATS)
+
+    def test_no_tags_still_marks_backfill_done(self):
+        make_baseline_db(self.path, [
+            ("generate", "Sports", None, None, None, '["", " "]', None),
+            ("generate", "Sports", None, None, None, "[]", None),
+        ])
+        app = self.start_app()
+        self.assertEqual(self.stats_after_startup(app)["interests"], {})
+        self.assertEqual(self.user_version(), app.SCHEMA_VERSION)
+
+        app = self.start_app()
+        with mock.patch.object(app, "backfill_tags", side_effect=AssertionError("backfill re-ran")):
+            self.stats_after_startup(app)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+Write-behind queue for /api/events on SQLite.
+
+Run from the repo root: python -m unittest discover tests
+"""
+import asyncio, importlib, os, tempfile, unittest
+from unittest import mock
+
+import orjson
+from fastapi import HTTPException
+from starlette.requests import Request
+
+GOOD = b'{"eventType": "generate", "categorySelected": "Sports", "interests": ["Art"]}'
+
+class EventQueueTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        env = mock.patch.dict(os.environ, {
+            "DB_PATH": os.path.join(tmp.name, "stats.db"),
+            "DATABASE_URL": "",
+            "STATS_CACHE_TTL": "0",
+            # Long enough that nothing is flushed before the test acts
+            "EVENT_FLUSH_SECONDS": "5",
+        })
+        env.start()
+        self.addCleanup(env.stop)
+        # Config is read at import: reload so each test sees its own DB
+        import app
+        self.app = importlib.reload(app)
+
+    async def post(self, body, query=b""):
+        """(status, payload) for one POST /api/events."""
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+        scope = {"type": "http", "method": "POST", "path": "/api/events",
+                 "headers": [], "query_string": query}
+        try:
+            result = await self.app.api_events(Request(scope, receive))
+        except HTTPException as e:
+            return e.status_code, {"detail": e.detail}
+        if isinstance(result, dict):
+            return 200, result
+        return result.status_code, orjson.loads(result.body)
+
+    async def stats(self):
+        return orjson.loads((await self.app.api_stats()).body)
+
+    def run_app(self, scenario):
+        async def run():
+            await self.app.on_startup()
+            try:
+                return await scenario()
+            finally:
+                await self.app.on_shutdown()
+        return asyncio.run(run())
+
+    def test_unstorable_row_is_rejected_without_losing_its_batch(self):
+        async def scenario():
+            statuses = [
+                await self.post(GOOD),
+                await self.post(b'{"eventType": "generate", "categorySelected": "\\ud800"}'),
+                await self.post(b'{"eventType": "generate", "interests": ["ok", "\\udfff"]}'),
+                await self.post(GOOD),
+            ]
+            await self.app.on_shutdown()  # drains the queue
+            await self.app.on_startup()
+            return statuses, await self.stats()
+
+        statuses, stats = self.run_app(scenario)
+        self.assertEqual([s for s, _ in statuses], [200, 400, 400, 200])
+        self.assertEqual([p["totalEventsNow"] for s, p in statuses if s == 200], [1, 2])
+        self.assertEqual(stats["totalEvents"], 2)
+        self.assertEqual(stats["interests"], {"art": 2})
+
+    def test_unstorable_row_is_rejected_on_sync_path(self):
+        async def scenario():
+            bad = await self.post(b'{"eventType": "shortlist", "shortlistedCCA": "\\ud800"}', b"sync=1")
+            good = await self.post(GOOD, b"sync=1")
+            return bad, good, await self.stats()
+
+        bad, good, stats = self.run_app(scenario)
+        self.assertEqual(bad[0], 400)
+        self.assertEqual(good, (200, {"ok": True, "totalEventsNow": 1, "storage": "sqlite"}))
+        self.assertEqual(stats["totalEvents"], 1)
+
+    def test_clear_removes_events_still_queued(self):
+        async def scenario():
+            for _ in range(3):
+                await self.post(GOOD)
+            cleared = await self.app.api_clear_stats()
+            after_clear = await self.stats()
+            posted = await self.post(GOOD)
+            await self.app.on_shutdown()  # drains the queue
+            await self.app.on_startup()
+            return cleared, after_clear, posted, await self.stats()
+
+        cleared, after_clear, posted, stats = self.run_app(scenario)
+        self.assertEqual(cleared["deleted"], 3)
+        self.assertEqual(after_clear["totalEvents"], 0)
+        self.assertEqual(posted[1]["totalEventsNow"], 1)
+        self.assertEqual(stats["totalEvents"], 1)
+
+if __name__ == "__main__":
+    unittest.main()